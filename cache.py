@@ -0,0 +1,87 @@
+"""
+This script handles the on-disk cache of the GAPS page. It is kept apart from the parser so that it can be used without
+loading requests, lxml and pandas, e.g. to clear the cache after logging in.
+
+The main functions in this script are:
+- load_cache: Loads the cached GAPS page of a user if it is still fresh.
+- store_cache: Stores the GAPS page of a user.
+- clear_cache: Removes the cached GAPS page of a user.
+"""
+
+from config import CACHE_DIR, CACHE_TTL
+import gzip
+import hashlib
+import os
+import time
+import zlib
+
+
+def cache_path(username):
+    """
+    Get the path of the cache file of a user. The username is hashed so that it does not appear on disk.
+
+    :param username: The GAPS username
+    :return: The path of the cache file
+    """
+
+    return os.path.join(CACHE_DIR, hashlib.sha256(username.encode("utf-8")).hexdigest() + ".html.gz")
+
+
+def load_cache(username):
+    """
+    Load the cached GAPS page of a user if it is younger than CACHE_TTL.
+
+    :param username: The GAPS username
+    :return: The cached HTML content as bytes, or None if there is no fresh and readable cache entry
+    """
+
+    path = cache_path(username)
+    try:
+        if time.time() - os.path.getmtime(path) >= CACHE_TTL:
+            return None
+    except OSError:
+        return None
+
+    try:
+        with gzip.open(path, "rb") as f:
+            return f.read()
+    except (OSError, EOFError, zlib.error):
+        # A truncated or corrupt entry is a cache miss, remove it so that it gets written again
+        clear_cache(username)
+        return None
+
+
+def store_cache(username, content):
+    """
+    Store the GAPS page of a user in the cache. Failing to write the cache is not fatal.
+
+    :param username: The GAPS username
+    :param content: The HTML content of the GAPS page as bytes
+    """
+
+    path = cache_path(username)
+    try:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        # The page holds the user's grades, keep it private even if the cache directory is not
+        fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            f.write(content)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print("Failed to write the GAPS data cache: ", e)
+
+
+def clear_cache(username):
+    """
+    Remove the cached GAPS page of a user, if any. Failing to remove the cache is not fatal.
+
+    :param username: The GAPS username
+    """
+
+    try:
+        os.remove(cache_path(username))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print("Failed to remove the GAPS data cache: ", e)
@@ -1,3 +1,5 @@
+import os
+
 APP_NAME = "autogaps"
 URL_BASE = "https://gaps.heig-vd.ch/consultation.php"
 URL = "https://gaps.heig-vd.ch/consultation/controlescontinus/consultation.php"
@@ -7,4 +9,15 @@ HEADER_DATA = {
     "User-Agent": "Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 5.1; Trident/4.0)",
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     "Accept-Language": "fr,fr-FR;q=0.8,en-US;q=0.5,en;q=0.3",
+    "Connection": "keep-alive",
 }
+# Seconds to wait for GAPS to connect or send data before giving up on a request
+REQUEST_TIMEOUT = 30
+# Daemon mode polls GAPS every POLL_INTERVAL seconds and retries failures after RETRY_DELAY seconds, doubling the
+# delay up to POLL_INTERVAL
+POLL_INTERVAL = 600
+RETRY_DELAY = 30
+# Fetched pages are cached on disk for CACHE_TTL seconds. The daemon always fetches and refreshes the cache, so one-shot
+# runs reuse its latest page as long as it is current
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", APP_NAME)
+CACHE_TTL = POLL_INTERVAL
@@ -0,0 +1,23 @@
+"""
+Exceptions raised by autogaps. Errors are raised rather than exiting so that the daemon mode can report them and retry
+without restarting the process.
+"""
+
+
+class AutogapsError(Exception):
+    """
+    An error that should be reported to the user, such as missing credentials or a failed request to GAPS.
+    """
+
+
+class GapsError(AutogapsError):
+    """
+    A failure to log in to or fetch data from GAPS. These are usually transient, the daemon mode retries them on the
+    same session.
+    """
+
+
+class ParseError(AutogapsError):
+    """
+    The GAPS page does not have the expected structure, e.g. a course without its grade table.
+    """
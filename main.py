@@ -1,19 +1,24 @@
 import config
 import argparse
+import functools
 import logging
 import sys
-import parser
 import re
 import keyring as kr
 import getpass
+import time
+from cache import clear_cache
+from errors import AutogapsError
 
 # Logger setup
 logging.basicConfig(format='%(levelname)s: %(message)s')
 
+_RE_USERNAME = re.compile(r"^[a-z]+\.[a-z]+$")
+
 
 def save_credentials():
     """
-    Save the user's credentials to the system keyring. Exits upon failure
+    Save the user's credentials to the system keyring. Raises an AutogapsError upon failure
     """
 
     logging.info("Your AAI credentials will be stored in the system keyring.")
@@ -22,31 +27,31 @@ def save_credentials():
 
     # Validate the input
     if not username or not password:
-        logging.error("You must enter a username and a password")
-        exit(1)
-    elif not re.match(r"^[a-z]+\.[a-z]+$", username):
-        logging.error("The username must be in the format first.last")
-        exit(1)
+        raise AutogapsError("You must enter a username and a password")
+    elif not _RE_USERNAME.match(username):
+        raise AutogapsError("The username must be in the format first.last")
 
     # Save the credentials to the system keyring
     try:
         kr.set_password(config.APP_NAME, username, password)
     except kr.errors.KeyringError as e:
-        logging.error("Failed to store credentials in keychain: %s", e)
-        exit(1)
-    except kr.errors.PasswordSetError:
-        logging.error("An error occured while saving the credentials")
-        exit(1)
+        raise AutogapsError("Failed to store credentials in keychain: {}".format(e)) from e
+    except kr.errors.PasswordSetError as e:
+        raise AutogapsError("An error occured while saving the credentials") from e
     except Exception as e:
-        logging.error("An unknown error occured while saving the credentials: %s", e)
-        exit(1)
+        raise AutogapsError("An unknown error occured while saving the credentials: {}".format(e)) from e
     else:
+        # Drop the memoized credentials and the page cached for this user so that the new ones are used
+        get_credentials.cache_clear()
+        clear_cache(username)
         logging.info("Credentials successfully saved to system keyring")
 
 
+@functools.lru_cache(maxsize=1)
 def get_credentials():
     """
-    Retrieve the user's credentials from the system keyring. Exits upon failure.
+    Retrieve the user's credentials from the system keyring. Raises an AutogapsError upon failure. The credentials are
+    memoized for the lifetime of the process to avoid a keyring round-trip on every daemon poll.
 
     :return: A keyring.Credential object containing the username and password
     :rtype: keyring.Credential
@@ -61,11 +66,10 @@ def get_credentials():
     except Exception as e:
         logging.error("An unexpected error occurred: %s", e)
 
-    # If the credentials are not found, display a message and exit.
+    # If the credentials are not found, report it to the caller.
     if cred is None:
-        logging.error("Failed to retrieve credentials. Please use `./autogaps.py --login` to save your login details "
-                      "to the system keyring.")
-        exit(1)
+        raise AutogapsError("Failed to retrieve credentials. Please use `./autogaps.py --login` to save your login "
+                            "details to the system keyring.")
 
     return cred
 
@@ -79,41 +83,97 @@ def compute_mean(data):
     :rtype: float
     """
 
-    grades = [float(course["grade"]) for course in data if course["grade"] is not None]
-    return sum(grades) / len(grades) if grades else 0
+    import numpy as np
+
+    grades = np.fromiter((course["grade"] for course in data if course["grade"] is not None), dtype=np.float64)
+    return grades.mean() if grades.size else 0
+
+
+def format_assessments(df):
+    """
+    Format the assessments of a course as aligned lines of date, description and grade. The columns are read directly
+    instead of dropping the unused ones and going through the DataFrame formatter.
+
+    :param df: The DataFrame containing the assessments data
+    :return: The formatted assessments, one per line
+    """
+
+    width = max(map(len, df["Description"]), default=0)
+    # The grade is printed as GAPS shows it, including its markers for missing grades
+    return "\n".join("{:<10} {:<{}} {}".format(date, description, width, grade).rstrip()
+                     for date, description, grade in zip(df["Date"], df["Description"], df["Grade"]))
 
 
 def display_data(data):
     for row in data:
         print("{}: {}".format(row["course"], row["grade"]))
 
-        assessment_data = row["assessment_data"].drop(columns=["Mean", "Weight"]).to_string(header=False, index=False, justify='left')
-        print("Assessments: {}\n{}".format(row["course_grade"], assessment_data))
+        print("Assessments: {}\n{}".format(row["course_grade"], format_assessments(row["assessment_data"])))
 
         if "practical_work_data" in row and row["practical_work_data"] is not None:
-            practical_work_data = row["practical_work_data"].drop(columns=["Mean", "Weight"]).to_string(header=False, index=False, justify='left')
-            print("Practical work: {}\n{}".format(row["lab_grade"], practical_work_data))
+            print("Practical work: {}\n{}".format(row["lab_grade"], format_assessments(row["practical_work_data"])))
 
         print("")
 
     print("Overall mean: {}".format(compute_mean(data)))
 
 
+def fetch_and_display(cred, use_cache=True):
+    """
+    Fetch the grades from GAPS, parse and display them. Raises an AutogapsError upon failure.
+
+    :param cred: A keyring.Credential object containing the username and password
+    :param use_cache: Whether a fresh cached GAPS page may be displayed instead of fetching it
+    """
+
+    # Deferred so that --login and --help do not pay for loading pandas, lxml and requests
+    import parser
+
+    root = parser.request_data(cred, use_cache)
+    data = parser.parse_tree(root)
+    display_data(data)
+
+
+def run_daemon():
+    """
+    Fetch and display the grades every config.POLL_INTERVAL seconds until interrupted. Failures to fetch the grades
+    are logged and retried with an exponential backoff instead of exiting. The cache is bypassed, each poll fetches the
+    grades and refreshes it.
+    """
+
+    cred = get_credentials()
+    backoff = config.RETRY_DELAY
+
+    while True:
+        try:
+            fetch_and_display(cred, use_cache=False)
+        except AutogapsError as e:
+            logging.error("%s. Retrying in %d seconds", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, config.POLL_INTERVAL)
+        else:
+            backoff = config.RETRY_DELAY
+            time.sleep(config.POLL_INTERVAL)
+
+
 def main():
     try:
         opt_parser = argparse.ArgumentParser(description="Fetch grades from the GAPS system.")
         opt_parser.add_argument("-l", "--login", action="store_true", help="input or replace the login credentials")
         opt_parser.add_argument("-d", "--daemon", action="store_true", help="run in daemon mode")
+        opt_parser.add_argument("-n", "--no-cache", action="store_true", help="fetch the grades even if a recent copy is cached")
         args = opt_parser.parse_args()
 
         if args.login:
             save_credentials()
+        elif args.daemon:
+            run_daemon()
         else:
-            cred = get_credentials()
-            data = parser.request_data(cred)
-            data = parser.parse(data)
-            display_data(data)
+            fetch_and_display(get_credentials(), not args.no_cache)
 
+    except AutogapsError as e:
+        logging.error(e)
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\nProgram interrupted by user. Exiting...")
         sys.exit(0)
@@ -3,156 +3,306 @@ This script is used to parse data from the GAPS system. It includes functions to
 extract tables from the HTML, convert these tables to pandas DataFrames, and convert these DataFrames to objects.
 
 The main functions in this script are:
-- request_data: Requests the data from GAPS and returns it as a string.
+- request_data: Requests the data from GAPS and returns it parsed as an HTML tree.
+- stream_tree / build_tree: Parse the streamed response or the HTML content into a tree.
 - parse: Parses the HTML content and returns a list of objects.
+- parse_tree: Parses the HTML tree and returns a list of objects.
 - extract_tables: Extracts tables from the HTML content.
+- row_to_cells: Extracts the text of the cells of a table row.
 - table_to_df: Converts the extracted tables to pandas DataFrames.
 - df_to_object: Converts the DataFrames to objects.
 
 This script uses the following libraries:
 - requests: To send HTTP requests.
-- BeautifulSoup: To parse the HTML content.
+- lxml: To parse the HTML content.
 - pandas: To work with the data in a tabular format.
+- numpy: To locate the subheader rows.
 - re: To use regular expressions.
-- io: To handle the StringIO object.
+- cache: To keep the fetched GAPS page on disk.
 """
 
-import config
+from config import HEADER_DATA, REQUEST_TIMEOUT, URL
+from errors import GapsError, ParseError
+from cache import load_cache, store_cache
 import requests
+from requests.adapters import HTTPAdapter
 import re
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
+import numpy as np
 import pandas as pd
-from io import StringIO
 
-# Set pandas to wholly display the DataFrames
-pd.set_option("display.max_columns", None)
-pd.set_option("display.max_rows", None)
-pd.set_option("display.width", None)
+_RE_FLOAT = re.compile(r"\d\.\d{1,2}")
+_RE_LOWERCASE = re.compile(r"^[a-z]+$")
+_RE_TRUNCATED = re.compile(r".*\[...\].*")
 
+# GAPS pages are UTF-8, declaring it lets lxml decode the raw bytes without guessing the encoding
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+_XPATH_BIGHEADER = etree.XPath(".//td[contains(concat(' ', normalize-space(@class), ' '), ' bigheader ')]")
 
-def request_data(cred):
+# Text only shown once logged in, encoded once to be searched in the raw response bytes
+_LOGIN_INDICATOR = "Etat des contrôles continus".encode("utf-8")
+# Class of the course headers, only present in a page holding the grade tables
+_TABLE_MARKER = b"bigheader"
+
+_COLUMNS = ["Header", "Date", "Description", "Mean", "Weight", "Grade"]
+# The Grade column keeps the text shown by GAPS, which marks missing grades with e.g. "-"
+_NUMERIC_COLUMNS = ["Mean", "Weight"]
+
+# The session lives as long as the process so that successive requests, e.g. in daemon mode, reuse the keep-alive
+# connection to GAPS instead of doing a new TCP and TLS handshake
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADER_DATA)
+_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+
+def request_data(cred, use_cache=True):
     """
-    Request the data from GAPS and return it as a string. Exits upon failure.
+    Request the data from GAPS and return it as a parsed HTML tree. The page is fed to the HTML parser while it is
+    downloaded so that parsing overlaps the transfer. Unless use_cache is False, a page fetched less than
+    config.CACHE_TTL seconds ago is served from the on-disk cache instead. A fetched page holding the grade tables is
+    always stored in the cache. Raises a GapsError upon failure, including network errors, and a ParseError if the
+    page cannot be parsed.
 
     :param cred: A keyring.Credential object containing the username and password
-    :return: The HTML content of the GAPS page as a string
-    """
-
-    with requests.session() as request:
-        print("Connection to GAPS...")
-        login_data = {
-            "login": cred.username,
-            "password": cred.password,
-            "submit": "enter",
-        }
-        grade_data = {
-            "rs": "smartReplacePart",
-            "rsargs": '["result","result",null,null,null,null]',
-        }
-
-        res = request.post(config.URL, data=login_data, headers=config.HEADER_DATA)
-
-        # Check for our successful login indicator
-        if res.text.find("Etat des contrôles continus") < 0:
-            print("An error occured while fetching the data from GAPS")
-            exit(1)
-        else:
-            res = request.post(config.URL, data=grade_data, headers=config.HEADER_DATA)
-            if res.status_code != 200:
-                print(
-                    "An error occured while fetching the data. Http status: ",
-                    res.status_code,
-                )
-                return None
-            print("Successfully retrieved GAPS data")
-            content = res.content.decode("utf-8")
-            return re.sub(r"\\", "", content)
+    :param use_cache: Whether a fresh cached page may be returned instead of fetching it
+    :return: The lxml root element of the GAPS page, or None if the page is empty
+    """
+
+    content = load_cache(cred.username) if use_cache else None
+    if content is not None:
+        print("Using cached GAPS data, run with --no-cache to fetch it again")
+        return build_tree(content)
+
+    print("Connection to GAPS...")
+    # Log in again on every call, only the connection is meant to outlive a request
+    _SESSION.cookies.clear()
+    login_data = {
+        "login": cred.username,
+        "password": cred.password,
+        "submit": "enter",
+    }
+    grade_data = {
+        "rs": "smartReplacePart",
+        "rsargs": '["result","result",null,null,null,null]',
+    }
+    try:
+        res = _SESSION.post(URL, data=login_data, timeout=REQUEST_TIMEOUT)
+
+        # Check for our successful login indicator on the raw bytes, the login page is never decoded
+        if _LOGIN_INDICATOR not in res.content:
+            raise GapsError("An error occured while fetching the data from GAPS")
+
+        res = _SESSION.post(URL, data=grade_data, stream=True, timeout=REQUEST_TIMEOUT)
+        if res.status_code != 200:
+            # Release the unread connection back to the pool
+            res.close()
+            raise GapsError("An error occured while fetching the data. Http status: {}".format(res.status_code))
+        content, root = stream_tree(res)
+    except requests.RequestException as e:
+        raise GapsError("Failed to connect to GAPS: {}".format(e)) from e
+
+    print("Successfully retrieved GAPS data")
+    # Only cache pages holding the course tables, an error page or an empty body must not be served again from the cache
+    if _TABLE_MARKER in content:
+        store_cache(cred.username, content)
+    return root
+
+
+def stream_tree(res):
+    """
+    Parses a streamed GAPS response into a tree, feeding each chunk to the HTML parser as it arrives. Raises a
+    ParseError if the page cannot be parsed.
+
+    :param res: The streamed requests.Response of the GAPS page
+    :return: A tuple of the HTML content of the page as bytes, kept for the cache, and the lxml root element of the page
+             or None if the page is empty
+    """
+
+    # A parser per response, feeding keeps the parsing state in the parser
+    feed_parser = lxml.html.HTMLParser(encoding="utf-8")
+    chunks = []
+
+    # Strip the escaping backslashes from the raw chunks before feeding them
+    for chunk in res.iter_content(chunk_size=16384):
+        chunk = chunk.translate(None, b"\\")
+        chunks.append(chunk)
+        feed_parser.feed(chunk)
+    content = b"".join(chunks)
+
+    # lxml refuses empty documents, an empty page simply holds no courses
+    if not content.strip():
+        return content, None
+
+    try:
+        return content, feed_parser.close()
+    except etree.LxmlError as e:
+        raise ParseError("Failed to parse the GAPS page: {}".format(e)) from e
+
+
+def build_tree(content):
+    """
+    Parses the HTML content of the GAPS page into a tree. Raises a ParseError if the page cannot be parsed.
+
+    :param content: The HTML content of the page as UTF-8 encoded bytes, unescaped and containing a valid HTML document
+                    tree
+    :return: The lxml root element of the page, or None if the page is empty
+    """
+
+    # lxml refuses empty documents, an empty page simply holds no courses
+    if not content.strip():
+        return None
+
+    try:
+        return lxml.html.document_fromstring(content, parser=_HTML_PARSER)
+    except etree.LxmlError as e:
+        raise ParseError("Failed to parse the GAPS page: {}".format(e)) from e
 
 
 def parse(content):
     """
+    Parses the GAPS page into course objects. Raises a ParseError when the page does not have the expected structure.
 
-    :param content: The HTML content of the page, unescaped and containing a valid HTML document tree
+    :param content: The HTML content of the page as UTF-8 encoded bytes, unescaped and containing a valid HTML document
+                    tree
     :return: An array of objects containing the course name, grade, assessments grade plus data and practical work grade
              and data
     """
 
-    soup = BeautifulSoup(content, "html.parser")
-    # Find all tags
-    tags = soup.find_all()
+    return parse_tree(build_tree(content))
 
-    # Iterate over the tags
-    for tag in tags:
-        # Check if the tag's content matches the pattern of incorrect content
-        if re.match(r'^[a-z]+$', tag.string):
-            # If it does, remove the content
-            tag.string.extract()
-            
-    tables = extract_tables(soup)
-    dfs = table_to_df(tables)
-    objects = []
 
-    for df in dfs:
-        objects.append(df_to_object(df))
+def parse_tree(root):
+    """
+    Parses the tree of the GAPS page into course objects. Raises a ParseError when the page does not have the expected
+    structure.
+
+    :param root: The lxml root element of the page, as returned by request_data or build_tree, or None for an empty page
+    :return: An array of objects containing the course name, grade, assessments grade plus data and practical work grade
+             and data
+    """
+
+    if root is None:
+        return []
+
+    # Only the table rows are used, so only clean up the elements inside them
+    for tr in root.iter("tr"):
+        for element in tr.iter(etree.Element):
+            # Only a leaf element's text is its sole content, elements with several children are left untouched
+            text = element.text if len(element) == 0 else None
+            # Check if the element's content matches the pattern of incorrect content, most texts already fail on their
+            # first character so only run the regex on the remaining ones
+            if text and "a" <= text[0] <= "z" and _RE_LOWERCASE.match(text):
+                # If it does, remove the content
+                element.text = None
+
+    tables = extract_tables(root)
+    dfs = table_to_df(tables)
 
-    return objects
+    return [df_to_object(df) for df in dfs]
 
 
-def extract_tables(soup):
+def extract_tables(root):
     """
     Extracts the (sub)tables from the HTML content.
 
-    :param soup: The BeautifulSoup object containing the HTML content
-    :return: A list of tables per course containing the parsed data
+    :param root: The lxml root element of the HTML content
+    :return: A list of tables per course, each table being a list of rows of cell texts
     """
 
     groups = []
     current_group = []
+    # Cells of the previous rows of the course spanning into the next row
+    spans = []
 
-    # Iterate over the trs and group them by course
-    trs = list(soup.find_all('tr'))
-    for i, tr in enumerate(trs):
-        td = tr.find('div', text=re.compile(r'.*\[...\].*'))
-        if td:
-            td.decompose()
-
-        if i + 1 < len(trs):
-            next_tr = trs[i + 1]
-            if next_tr.find('td', {'class': 'bigheader'}):
-                current_group.append(tr)
-                groups.append(current_group)
-                current_group = []
-            else:
-                current_group.append(tr)
-        else:
-            current_group.append(tr)
+    # Iterate over the trs and start a new group at each course header
+    for tr in root.iter("tr"):
+        div = next((div for div in tr.iter("div") if len(div) == 0 and div.text and "[" in div.text and _RE_TRUNCATED.search(div.text)), None)
+        if div is not None:
+            div.drop_tree()
+
+        if current_group and _XPATH_BIGHEADER(tr):
             groups.append(current_group)
+            current_group = []
+            spans = []
+        cells, spans = row_to_cells(tr, spans)
+        current_group.append(cells)
+
+    if current_group:
+        groups.append(current_group)
 
     return groups
 
 
+def row_to_cells(tr, spans):
+    """
+    Extracts the text of the cells of a table row, expanding colspan and rowspan like pandas.read_html does: the text
+    of a cell spanning multiple columns or rows is repeated in each of them, line breaks separate words and whitespace
+    is collapsed.
+
+    :param tr: The lxml element of the table row
+    :param spans: The cells of the previous rows spanning into this one, as returned for the previous row
+    :return: A tuple of the list containing the text of each column of the row and the cells spanning into the next row,
+             as a list of (column, text, remaining rows) tuples
+    """
+
+    cells = []
+    next_spans = []
+    spans = list(spans)
+
+    # Only walk the direct cells of the row, like pandas.read_html does
+    for td in tr.iterchildren("td", "th"):
+        # Insert the cells of the previous rows spanning into this column
+        while spans and spans[0][0] <= len(cells):
+            column, text, rowspan = spans.pop(0)
+            cells.append(text)
+            if rowspan > 1:
+                next_spans.append((column, text, rowspan - 1))
+
+        # text_content() glues the text around a <br> together, turn it into a line break like pandas.read_html
+        for br in td.iter("br"):
+            br.tail = "\n" + (br.tail or "")
+        text = " ".join(td.text_content().split())
+        colspan = _span(td, "colspan")
+        rowspan = _span(td, "rowspan")
+        for _ in range(colspan):
+            if rowspan > 1:
+                next_spans.append((len(cells), text, rowspan - 1))
+            cells.append(text)
+
+    # Spanning cells past the last cell of the row end it
+    for column, text, rowspan in spans:
+        cells.append(text)
+        if rowspan > 1:
+            next_spans.append((column, text, rowspan - 1))
+
+    return cells, next_spans
+
+
+def _span(td, attribute):
+    """
+    Reads the colspan or rowspan of a cell, defaulting to 1 when it is missing or invalid.
+    """
+
+    value = td.get(attribute, "1")
+    return int(value) if value.isdigit() and int(value) > 0 else 1
+
+
 def table_to_df(tables):
     """
     Converts the tables to pandas DataFrames.
 
-    :param tables: The list of tables to convert
+    :param tables: The list of tables to convert, as returned by extract_tables
     :return: A array of pandas DataFrames containing the GAPS grade data
     """
 
     dfs = []
     for table in tables:
-        soup = BeautifulSoup('<table></table>', 'html.parser')
-        table_tag = soup.table
-
-        for tr in table:
-            table_tag.append(tr)
-
-        html_table = str(table_tag)
-        html_io = StringIO(html_table)
-
-        print(pd.read_html(html_io))
-        df = pd.read_html(html_io)[0]
-        df.columns = ["Header", "Date", "Description", "Mean", "Weight", "Grade"]
+        # Pad or truncate the rows to the expected columns
+        rows = [(cells + [""] * len(_COLUMNS))[:len(_COLUMNS)] for cells in table]
+        # Transpose the rows into one list per column, which pandas turns into the column arrays directly instead of
+        # going through a 2D object array
+        df = pd.DataFrame(dict(zip(_COLUMNS, map(list, zip(*rows)))), columns=_COLUMNS)
         dfs.append(df)
     return dfs
 
@@ -161,43 +311,54 @@ def df_to_object(df):
     """
     Converts the DataFrames to a key-value dictionary containing the GAPS grade data with the following schema:
         course: The name of the course
-        grade: The grade of the course
-        course_grade: The grade of the assessments
-        course_data: The DataFrame containing the assessments data
-        lab_grade: The grade of the practical work
-        lab_data: The DataFrame containing the practical work data
+        grade: The grade of the course, as a float
+        course_grade: The grade of the assessments, as a float
+        assessment_data: The DataFrame containing the assessments data
+        lab_grade: The grade of the practical work, as a float
+        practical_work_data: The DataFrame containing the practical work data
+
+    The grades are None when GAPS does not show them yet. The Mean and Weight columns are float64, the Grade column keeps
+    the text shown by GAPS.
 
     :param df: The DataFrame to convert
     :return: A key-value dictionary containing the GAPS grade data
     """
 
-    re_float = r"\d\.\d{1,2}"
     data = {}
 
-    header = df.iloc[0].to_dict()["Header"]
+    # Fetch the Header column once, the course header and the subheaders are all read from it
+    headers = df["Header"].to_numpy()
+    header = headers[0]
 
     data["course"] = header.split(" ")[0] if header else None
 
-    grade = re.findall(re_float, header)
-    data["grade"] = grade[0] if grade else None
+    grade = _RE_FLOAT.findall(header)
+    data["grade"] = float(grade[0]) if grade else None
+
+    # Locate the subheader rows with a single pass over the Grade column
+    subheaders = np.flatnonzero(df["Grade"].to_numpy() == "note")
+    if not len(subheaders):
+        raise ParseError("Unexpected GAPS page: the course {} has no grade table".format(data["course"]))
 
     # Extract the course grades
-    subheaders = df.loc[df['Grade'] == 'note']["Header"]
-    course_grade = re.findall(re_float, subheaders.values[0])
-    data["course_grade"] = course_grade[0] if course_grade else None
+    course_grade = _RE_FLOAT.findall(headers[subheaders[0]])
+    data["course_grade"] = float(course_grade[0]) if course_grade else None
 
     # Extract the lab grade if present
-    lab_header = re.findall(re_float, subheaders.values[1]) if len(subheaders.values) > 1 else None
-    data["lab_grade"] = lab_header[0] if lab_header else None
+    lab_header = _RE_FLOAT.findall(headers[subheaders[1]]) if len(subheaders) > 1 else None
+    data["lab_grade"] = float(lab_header[0]) if lab_header else None
+
+    # Now that the subheaders are known, convert the mean and weight columns to numbers
+    df[_NUMERIC_COLUMNS] = df[_NUMERIC_COLUMNS].apply(pd.to_numeric, errors="coerce")
 
     # Drop the first column of the dataframe since it's not needed anymore
     df = df.drop(columns=["Header"])
 
     # Extract the course and lab dataframes
     if lab_header:
-        data["assessment_data"] = df.iloc[subheaders.index[0] + 1: subheaders.index[1]].reset_index(drop=True)
-        data["practical_work_data"] = df.iloc[subheaders.index[1] + 1:].reset_index(drop=True)
+        data["assessment_data"] = df.iloc[subheaders[0] + 1: subheaders[1]].reset_index(drop=True)
+        data["practical_work_data"] = df.iloc[subheaders[1] + 1:].reset_index(drop=True)
     else:
-        data["assessment_data"] = df.iloc[subheaders.index[0] + 1:].reset_index(drop=True)
+        data["assessment_data"] = df.iloc[subheaders[0] + 1:].reset_index(drop=True)
 
     return data
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the root of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+import parser
+
+
+class FakeResponse:
+    """A stand-in for the requests.Response objects returned by parser._SESSION.post"""
+
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Never read or write the user's own cache
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def gaps_post(monkeypatch):
+    """Serve the given responses, or raise the given exceptions, from successive posts to GAPS"""
+
+    def serve(*responses):
+        responses = list(responses)
+
+        def post(url, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        monkeypatch.setattr(parser._SESSION, "post", post)
+
+    return serve
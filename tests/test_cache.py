@@ -0,0 +1,72 @@
+import os
+import stat
+import time
+
+from keyring.credentials import SimpleCredential
+
+import cache
+import main
+import parser
+from conftest import FakeResponse
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "gaps.html")
+
+
+def test_store_and_load():
+    cache.store_cache("first.last", b"<html></html>")
+    assert cache.load_cache("first.last") == b"<html></html>"
+    assert cache.load_cache("other.user") is None
+
+
+def test_expired_entry_is_a_miss():
+    cache.store_cache("first.last", b"<html></html>")
+    expired = time.time() - cache.CACHE_TTL
+    os.utime(cache.cache_path("first.last"), (expired, expired))
+
+    assert cache.load_cache("first.last") is None
+
+
+def test_file_is_private():
+    cache.store_cache("first.last", b"<html></html>")
+    assert stat.S_IMODE(os.stat(cache.cache_path("first.last")).st_mode) == 0o600
+
+
+def test_corrupt_entry_is_removed():
+    cache.store_cache("first.last", b"<html></html>" * 100)
+    path = cache.cache_path("first.last")
+    with open(path, "rb") as f:
+        truncated = f.read()[:20]
+    with open(path, "wb") as f:
+        f.write(truncated)
+
+    assert cache.load_cache("first.last") is None
+    assert not os.path.exists(path)
+
+
+def test_login_clears_cache(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda prompt: "first.last")
+    monkeypatch.setattr(main.getpass, "getpass", lambda prompt: "password")
+    monkeypatch.setattr(main.kr, "set_password", lambda *args: None)
+    cache.store_cache("first.last", b"<html></html>")
+
+    main.save_credentials()
+
+    assert not os.path.exists(cache.cache_path("first.last"))
+
+
+def test_grade_page_is_cached(gaps_post):
+    with open(FIXTURE, "rb") as f:
+        page = f.read()
+    gaps_post(FakeResponse(parser._LOGIN_INDICATOR), FakeResponse(page))
+
+    parser.request_data(SimpleCredential("first.last", "password"), use_cache=False)
+
+    assert cache.load_cache("first.last") == page
+
+
+def test_page_without_grade_tables_is_not_cached(gaps_post):
+    gaps_post(FakeResponse(parser._LOGIN_INDICATOR), FakeResponse(b"<html><body>Erreur</body></html>"))
+
+    parser.request_data(SimpleCredential("first.last", "password"), use_cache=False)
+
+    assert not os.path.exists(cache.cache_path("first.last"))
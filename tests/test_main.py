@@ -0,0 +1,100 @@
+import os
+
+import pytest
+from keyring.credentials import SimpleCredential
+
+import config
+import main
+import parser
+from errors import GapsError
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "gaps.html")
+
+
+def test_format_assessments():
+    with open(FIXTURE, "rb") as f:
+        courses = parser.parse(f.read())
+
+    # The missing grade is shown with GAPS' own marker
+    assert main.format_assessments(courses[0]["assessment_data"]).splitlines() == [
+        "05.10.2023 Test 1 4.8",
+        "12.11.2023 Test 2 -",
+    ]
+
+
+def test_format_assessments_whole_grade():
+    with open(FIXTURE, "rb") as f:
+        courses = parser.parse(f.read())
+
+    # Whole grades are not turned into floats
+    assert main.format_assessments(courses[1]["assessment_data"]).splitlines() == [
+        "03.01.2024 Examen 5.1",
+        "10.01.2024 Projet 6",
+    ]
+
+
+def test_compute_mean():
+    assert main.compute_mean([{"grade": 4.5}, {"grade": 5.0}, {"grade": None}]) == 4.75
+    assert main.compute_mean([]) == 0
+
+
+class StopDaemon(Exception):
+    pass
+
+
+def test_run_daemon_backoff(monkeypatch):
+    # Three failures, one success, then a failure again
+    outcomes = [GapsError("down"), GapsError("down"), GapsError("down"), None, GapsError("down")]
+    sleeps = []
+
+    def fetch_and_display(cred, use_cache=True):
+        assert not use_cache
+        outcome = outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if not outcomes:
+            raise StopDaemon
+
+    monkeypatch.setattr(main, "get_credentials", lambda: None)
+    monkeypatch.setattr(main, "fetch_and_display", fetch_and_display)
+    monkeypatch.setattr(main.time, "sleep", sleep)
+    monkeypatch.setattr(config, "RETRY_DELAY", 30)
+    monkeypatch.setattr(config, "POLL_INTERVAL", 100)
+
+    with pytest.raises(StopDaemon):
+        main.run_daemon()
+
+    # The delay doubles up to the poll interval and is reset by a successful poll
+    assert sleeps == [30, 60, 100, 100, 30]
+
+
+def test_get_credentials_refreshed_after_login(monkeypatch):
+    stored = {"cred": SimpleCredential("first.last", "old")}
+    lookups = []
+
+    def get_credential(service, username):
+        lookups.append(service)
+        return stored["cred"]
+
+    def set_password(service, username, password):
+        stored["cred"] = SimpleCredential(username, password)
+
+    monkeypatch.setattr(main.kr, "get_credential", get_credential)
+    monkeypatch.setattr(main.kr, "set_password", set_password)
+    monkeypatch.setattr("builtins.input", lambda prompt: "first.last")
+    monkeypatch.setattr(main.getpass, "getpass", lambda prompt: "new")
+    main.get_credentials.cache_clear()
+
+    # The keyring is only queried once while the credentials are memoized
+    assert main.get_credentials().password == "old"
+    assert main.get_credentials().password == "old"
+    assert len(lookups) == 1
+
+    main.save_credentials()
+
+    assert main.get_credentials().password == "new"
+    assert len(lookups) == 2
+    main.get_credentials.cache_clear()
@@ -0,0 +1,101 @@
+import os
+from io import StringIO
+
+import lxml.html
+import pandas as pd
+import pytest
+import requests
+from keyring.credentials import SimpleCredential
+
+import parser
+from conftest import FakeResponse
+from errors import GapsError, ParseError
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "gaps.html")
+CRED = SimpleCredential("first.last", "password")
+
+
+@pytest.fixture
+def courses():
+    with open(FIXTURE, "rb") as f:
+        return parser.parse(f.read())
+
+
+def test_parse_courses(courses):
+    assert [course["course"] for course in courses] == ["MAT1", "PRG2"]
+    assert [course["grade"] for course in courses] == [4.5, 5.1]
+    assert [course["course_grade"] for course in courses] == [4.6, 5.1]
+    assert [course["lab_grade"] for course in courses] == [4.3, None]
+    assert "practical_work_data" not in courses[1]
+
+
+def test_parse_assessments(courses):
+    assessments = courses[0]["assessment_data"]
+    assert assessments["Date"].tolist() == ["05.10.2023", "12.11.2023"]
+    # The truncated description marker and the stray lowercase content are removed
+    assert assessments["Description"].tolist() == ["Test 1", "Test 2"]
+    assert assessments["Mean"].tolist() == [4.2, 4.0]
+    assert assessments["Weight"].tolist() == [50, 50]
+    assert assessments["Grade"].tolist() == ["4.8", "-"]
+
+
+def test_parse_practical_work_with_rowspan(courses):
+    practical_work = courses[0]["practical_work_data"]
+    assert practical_work["Date"].tolist() == ["01.12.2023", "08.12.2023"]
+    assert practical_work["Description"].tolist() == ["Labo 1", "Labo 2"]
+    assert practical_work["Grade"].tolist() == ["4.3", "4.3"]
+
+
+def test_spans_match_read_html():
+    html = ("<table><tr><td rowspan=2>A</td><td colspan=2 rowspan=3>B</td><td>C</td><td>I</td><td>J</td></tr>"
+            "<tr><td>D</td><td>K</td><td>L</td></tr>"
+            "<tr><td>E</td><td rowspan=2>F</td><td>M</td><td>N</td></tr>"
+            "<tr><th>G</th><td>H</td><td>O<br/>final</td><td>P</td></tr></table>")
+
+    expected = pd.read_html(StringIO(html), flavor="lxml")[0].fillna("")
+    df = parser.table_to_df(parser.extract_tables(lxml.html.document_fromstring(html)))[0]
+
+    assert df.values.tolist() == expected.values.tolist()
+
+
+def test_parse_empty_page():
+    assert parser.parse(b"") == []
+    assert parser.parse(b" \n") == []
+
+
+def test_parse_course_without_grade_table():
+    with pytest.raises(ParseError):
+        parser.parse(b'<table><tr><td class="bigheader" colspan="6">MAT1 moyenne : 4.5</td></tr></table>')
+
+
+def test_request_data(gaps_post):
+    with open(FIXTURE, "rb") as f:
+        page = f.read()
+    gaps_post(FakeResponse(parser._LOGIN_INDICATOR), FakeResponse(page))
+
+    courses = parser.parse_tree(parser.request_data(CRED, use_cache=False))
+
+    assert [course["course"] for course in courses] == ["MAT1", "PRG2"]
+
+
+def test_request_data_bad_login(gaps_post):
+    gaps_post(FakeResponse(b"<html>Identifiant ou mot de passe incorrect</html>"))
+
+    with pytest.raises(GapsError):
+        parser.request_data(CRED, use_cache=False)
+
+
+def test_request_data_bad_status(gaps_post):
+    response = FakeResponse(b"", status_code=500)
+    gaps_post(FakeResponse(parser._LOGIN_INDICATOR), response)
+
+    with pytest.raises(GapsError, match="500"):
+        parser.request_data(CRED, use_cache=False)
+    assert response.closed
+
+
+def test_request_data_connection_error(gaps_post):
+    gaps_post(requests.Timeout("timed out"))
+
+    with pytest.raises(GapsError, match="timed out"):
+        parser.request_data(CRED, use_cache=False)